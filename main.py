@@ -1,30 +1,65 @@
 import sqlite3
 import uuid
+import hmac
+import asyncio
+import threading
+import urllib.request
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Body, Header, Depends
+from fastapi import FastAPI, HTTPException, Body, Header, Depends, Response
 from pydantic import BaseModel
 import time
 import os
+import logging
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+from cachetools import TTLCache
+import aiosqlite
+import orjson
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global PENDING_PAINTS
+    await open_db()
+    PENDING_PAINTS = asyncio.Queue()
+    flusher = asyncio.create_task(paint_flusher())
+    yield
+    # Stop the flusher and let it write out whatever is still queued
+    PENDING_PAINTS.put_nowait(None)
+    await flusher
+    await close_db()
+
+app = FastAPI(lifespan=lifespan)
 
 # --- Configuration & Security ---
 ANKIPLACE_SECRET = os.getenv("ANKIPLACE_SECRET", "change-me-please")
 
 # Simple in-memory rate limiting: {user_id: last_request_time}
+# Kept in least-recently-seen order and capped, so memory doesn't grow with every user ever seen.
+# This is per process; the Dockerfile runs a single worker.
+# Split into independently locked shards so concurrent checks for different users rarely contend.
 RATE_LIMIT_COOLDOWN = 1.0 # seconds
-user_last_request = {}
+RATE_LIMIT_MAX_USERS = 100_000
+RATE_LIMIT_SHARDS = 64 # power of two, shards are picked with a mask
+_rate_limit_shards = [(threading.Lock(), OrderedDict()) for _ in range(RATE_LIMIT_SHARDS)]
 
 async def verify_secret(x_ankiplace_secret: str = Header(None)):
-    if x_ankiplace_secret != ANKIPLACE_SECRET:
+    # Constant-time comparison so response timing doesn't leak how much of the secret matched.
+    # Compared as bytes: compare_digest rejects non-ASCII str, and header values can be anything.
+    if not hmac.compare_digest((x_ankiplace_secret or "").encode(), ANKIPLACE_SECRET.encode()):
         raise HTTPException(status_code=403, detail="Invalid or missing secret key")
 
 def check_rate_limit(user_id: str):
-    now = time.time()
-    last_time = user_last_request.get(user_id, 0)
-    if now - last_time < RATE_LIMIT_COOLDOWN:
-        raise HTTPException(status_code=429, detail="Too many requests. Please wait.")
-    user_last_request[user_id] = now
+    # monotonic() so that wall-clock adjustments can't lock users out or let them through
+    now = time.monotonic()
+    lock, user_last_request = _rate_limit_shards[hash(user_id) & (RATE_LIMIT_SHARDS - 1)]
+    with lock:
+        last_time = user_last_request.get(user_id)
+        if last_time is not None and now - last_time < RATE_LIMIT_COOLDOWN:
+            raise HTTPException(status_code=429, detail="Too many requests. Please wait.")
+        user_last_request[user_id] = now
+        user_last_request.move_to_end(user_id)
+        if len(user_last_request) > RATE_LIMIT_MAX_USERS // RATE_LIMIT_SHARDS:
+            user_last_request.popitem(last=False)
 
 # --- Database ---
 DB_FILE = os.getenv("DB_PATH", "canvas.db") # Default to local for dev, override for Docker
@@ -34,11 +69,63 @@ db_dir = os.path.dirname(DB_FILE)
 if db_dir and not os.path.exists(db_dir):
     os.makedirs(db_dir, exist_ok=True)
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+# WAL lets readers run while a write is in flight, and with WAL synchronous=NORMAL
+# only fsyncs at checkpoints. journal_mode is persisted in the database file; the
+# rest are per-connection and applied to every connection we open.
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-64000',
+    'PRAGMA wal_autocheckpoint=1000',
+)
+
+# Statements used by the request paths. Keeping them as constants means each
+# connection's statement cache sees the same strings and reuses compiled statements.
+SQL_GET_CANVAS_BLOB = 'SELECT colors FROM canvas_blob WHERE id = 0'
+SQL_SET_CANVAS_BLOB = 'UPDATE canvas_blob SET colors = ? WHERE id = 0'
+SQL_PAINT_CANVAS = 'UPDATE canvas SET color = ?, last_user_id = ?, last_modified = ? WHERE x = ? AND y = ?'
+# Join with users table to get username
+SQL_GET_PIXEL = '''
+    SELECT canvas.*, users.username
+    FROM canvas
+    LEFT JOIN users ON canvas.last_user_id = users.user_id
+    WHERE x = ? AND y = ?
+'''
+SQL_GET_USER = 'SELECT username, created_at, paint_balance FROM users WHERE user_id = ?'
+SQL_USER_EXISTS = 'SELECT 1 FROM users WHERE user_id = ?'
+SQL_INSERT_USER = 'INSERT INTO users (user_id, username, created_at) VALUES (?, ?, ?)'
+SQL_DEBIT_PAINT = 'UPDATE users SET paint_balance = paint_balance - ? WHERE user_id = ? AND paint_balance >= ?'
+SQL_GET_TOTAL_PROOFS = 'SELECT total_proofs FROM users WHERE user_id = ?'
+SQL_INSERT_PROOF = 'INSERT OR IGNORE INTO review_proofs (user_id, card_id, timestamp) VALUES (?, ?, ?)'
+SQL_AWARD_PAINT = 'UPDATE users SET total_proofs = ?, paint_balance = paint_balance + ? WHERE user_id = ?'
+
 def get_db_connection():
+    """Opens a blocking connection; only used by init_db before the app starts."""
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+async def open_async_connection(read_only: bool = False) -> aiosqlite.Connection:
+    if read_only:
+        conn = await aiosqlite.connect(f"file:{urllib.request.pathname2url(os.path.abspath(DB_FILE))}?mode=ro", uri=True)
+    else:
+        conn = await aiosqlite.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        await conn.execute(pragma)
     return conn
 
+async def fetch_one(conn: aiosqlite.Connection, sql: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+    """Runs a query and returns its first row in one round trip to the connection thread."""
+    rows = await conn.execute_fetchall(sql, params)
+    return rows[0] if rows else None
+
 def init_db():
     conn = get_db_connection()
     c = conn.cursor()
@@ -59,7 +146,8 @@ def init_db():
             user_id TEXT PRIMARY KEY,
             username TEXT,
             paint_balance INTEGER DEFAULT 0,
-            created_at REAL
+            created_at REAL,
+            total_proofs INTEGER DEFAULT 0
         )
     ''')
     # Review proofs table [NEW]
@@ -71,20 +159,215 @@ def init_db():
             PRIMARY KEY (user_id, card_id, timestamp)
         )
     ''')
+    # Running proof count per user, so awarding paint doesn't count review_proofs
+    user_columns = [row['name'] for row in c.execute('PRAGMA table_info(users)')]
+    if 'total_proofs' not in user_columns:
+        c.execute('ALTER TABLE users ADD COLUMN total_proofs INTEGER DEFAULT 0')
+        c.execute('''
+            UPDATE users SET total_proofs = (
+                SELECT count(*) FROM review_proofs WHERE review_proofs.user_id = users.user_id
+            )
+        ''')
+    # Packed canvas colors: one byte per pixel, row by row (index = y * 32 + x).
+    # The canvas table above is kept for per-pixel attribution (/pixel/{x}/{y}).
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS canvas_blob (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            colors BLOB NOT NULL
+        )
+    ''')
     
-    # Initialize canvas if empty
-    c.execute('SELECT count(*) FROM canvas')
-    if c.fetchone()[0] == 0:
-        for x in range(32):
-            for y in range(32):
-                c.execute('INSERT INTO canvas (x, y, color, last_user_id, last_modified) VALUES (?, ?, ?, ?, ?)',
-                          (x, y, 0, None, 0))
+    # Initialize the canvas on first start. The blob row is written last, so once it
+    # exists there is nothing to do and startup costs a single primary-key lookup.
+    c.execute('SELECT 1 FROM canvas_blob WHERE id = 0')
+    if not c.fetchone():
+        # Add any missing pixel rows (all of them on a new database) in one statement and
+        # one transaction (committed below), then build the blob from the rows so
+        # databases that predate it keep their colors
+        c.executemany('INSERT OR IGNORE INTO canvas (x, y, color, last_user_id, last_modified) VALUES (?, ?, 0, NULL, 0)',
+                      [(x, y) for y in range(32) for x in range(32)])
+        colors = bytearray(32 * 32)
+        for row in c.execute('SELECT x, y, color FROM canvas'):
+            colors[row['y'] * 32 + row['x']] = row['color']
+        c.execute('INSERT INTO canvas_blob (id, colors) VALUES (0, ?)', (bytes(colors),))
     
     conn.commit()
+    # Refresh planner statistics when SQLite thinks they're stale (cheap otherwise)
+    c.execute('PRAGMA optimize')
     conn.close()
 
 init_db()
 
+# Connections are opened once in the app lifespan and shared between requests:
+# one dedicated writer (SQLite only allows a single writer at a time anyway),
+# guarded by an asyncio.Lock, and a pool of read-only connections for the GET
+# routes. aiosqlite runs each connection on its own thread, so queries don't
+# block the event loop. Route handlers and the flusher all run on the event
+# loop, so the in-memory state below needs no thread locks.
+_WRITER: Optional[aiosqlite.Connection] = None
+_WRITER_LOCK: Optional[asyncio.Lock] = None
+_READERS: "Optional[asyncio.Queue[aiosqlite.Connection]]" = None
+
+async def open_db():
+    global _WRITER, _WRITER_LOCK, _READERS
+    _WRITER = await open_async_connection()
+    _WRITER_LOCK = asyncio.Lock()
+    _READERS = asyncio.Queue()
+    for _ in range(max(DB_POOL_SIZE - 1, 1)):
+        _READERS.put_nowait(await open_async_connection(read_only=True))
+    
+    CANVAS[:] = (await fetch_one(_WRITER, SQL_GET_CANVAS_BLOB))['colors']
+
+async def close_db():
+    while not _READERS.empty():
+        await _READERS.get_nowait().close()
+    await _WRITER.close()
+
+@asynccontextmanager
+async def read_db():
+    """Checks a reader out of the pool. Routes take it only once they know they need
+    the database, so cache hits don't wait behind real reads."""
+    conn = await _READERS.get()
+    try:
+        yield conn
+    finally:
+        _READERS.put_nowait(conn)
+
+async def get_write_db():
+    async with _WRITER_LOCK:
+        try:
+            yield _WRITER
+        finally:
+            # Drop anything left uncommitted by a route that bailed out early
+            if _WRITER.in_transaction:
+                await _WRITER.rollback()
+
+# --- Canvas cache ---
+# The canvas only changes through /paint, so GET /canvas is served from memory.
+# CANVAS mirrors canvas_blob; CANVAS_JSON caches the encoded /canvas body and is
+# rebuilt lazily after a paint. CANVAS_VERSION is bumped on every paint and is
+# used as the ETag; it starts from the boot time so tags from a previous process
+# never match. Microseconds rather than nanoseconds keep it below 2**53, so it
+# survives JSON.parse in JS clients polling /canvas/version.
+CANVAS = bytearray(32 * 32)
+CANVAS_JSON: Optional[bytes] = None
+CANVAS_VERSION = time.time_ns() // 1000
+
+def set_canvas_pixel(x: int, y: int, color: int):
+    global CANVAS_JSON, CANVAS_VERSION
+    CANVAS[y * 32 + x] = color
+    CANVAS_JSON = None
+    CANVAS_VERSION += 1
+
+def in_bounds(x: int, y: int) -> bool:
+    # The canvas is 32x32, so a coordinate is valid iff no bit outside the low 5 is set
+    # (this also rejects negatives)
+    return (x & ~31) == 0 and (y & ~31) == 0
+
+def valid_color(color: int) -> bool:
+    return (color & ~15) == 0 # Assuming 16 colors
+
+def canvas_etag() -> str:
+    return f'"{CANVAS_VERSION}"'
+
+# --- Read caches ---
+# Short-lived caches so bursts of identical /pixel and /user lookups hit SQLite
+# once. Entries are dropped after the writes that change them. Only hits are
+# cached, so a freshly registered user is visible immediately.
+PIXEL_CACHE: "TTLCache[tuple, dict]" = TTLCache(maxsize=1024, ttl=0.25)
+USER_CACHE: "TTLCache[str, sqlite3.Row]" = TTLCache(maxsize=10_000, ttl=1.0)
+
+async def get_user_row(user_id: str) -> Optional[sqlite3.Row]:
+    """Returns the user's row (username, created_at, paint_balance), cached briefly."""
+    row = USER_CACHE.get(user_id)
+    if row is None:
+        async with read_db() as conn:
+            row = await fetch_one(conn, SQL_GET_USER, (user_id,))
+        if row:
+            USER_CACHE[user_id] = row
+    return row
+
+def invalidate_user(user_id: str):
+    USER_CACHE.pop(user_id, None)
+
+# --- Paint write-behind ---
+# /paint updates CANVAS immediately and queues the pixel; paint_flusher writes
+# queued pixels to the database in one transaction per batch, so a burst of
+# paints costs one commit instead of one each. The queue is unbounded on
+# purpose: producers hold the writer lock, so blocking on a full queue would
+# deadlock against the flusher. Every paint costs a paint drop, which bounds it.
+# The queue is created in lifespan so it belongs to the running event loop.
+# PENDING_PIXELS holds the latest queued paint for each pixel until it has been
+# committed, so /pixel/{x}/{y} agrees with /canvas in the meantime.
+PAINT_FLUSH_INTERVAL = 0.025 # seconds
+PAINT_FLUSH_MAX_BATCH = 256
+PAINT_BATCH_MAX = 64 # pixels per /paint/batch request
+PENDING_PAINTS: "Optional[asyncio.Queue[Optional[tuple]]]" = None
+PENDING_PIXELS: "dict[tuple, tuple]" = {} # {(x, y): (color, user_id, timestamp)}
+
+async def flush_paints(batch: List[tuple]):
+    """Writes a batch of (color, user_id, timestamp, x, y) paints in one transaction."""
+    async with _WRITER_LOCK:
+        try:
+            await _WRITER.executemany(SQL_PAINT_CANVAS, batch)
+            await _WRITER.execute(SQL_SET_CANVAS_BLOB, (bytes(CANVAS),))
+            await _WRITER.commit()
+        finally:
+            if _WRITER.in_transaction:
+                await _WRITER.rollback()
+    for color, user_id, timestamp, x, y in batch:
+        PIXEL_CACHE.pop((x, y), None)
+        # Leave the entry alone if the pixel was painted again since this batch was taken
+        if PENDING_PIXELS.get((x, y)) == (color, user_id, timestamp):
+            del PENDING_PIXELS[(x, y)]
+
+async def paint_flusher():
+    """Drains PENDING_PAINTS until it receives None."""
+    running = True
+    while running:
+        item = await PENDING_PAINTS.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = time.monotonic() + PAINT_FLUSH_INTERVAL
+        while len(batch) < PAINT_FLUSH_MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(PENDING_PAINTS.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                running = False
+                break
+            batch.append(item)
+        try:
+            await flush_paints(batch)
+        except sqlite3.Error:
+            # Keep the flusher alive; CANVAS still holds these pixels
+            logging.exception("Failed to flush %d paints", len(batch))
+
+async def debit_paint(conn: aiosqlite.Connection, user_id: str, amount: int):
+    """Deducts `amount` paint drops and commits, or raises 404/403 without touching the balance."""
+    # Check and deduct in a single statement
+    c = await conn.execute(SQL_DEBIT_PAINT, (amount, user_id, amount))
+    if c.rowcount == 0:
+        # Nothing was debited: either the user doesn't exist or they're out of paint
+        if not await fetch_one(conn, SQL_USER_EXISTS, (user_id,)):
+            raise HTTPException(status_code=404, detail="User ID not found. Register first.")
+        raise HTTPException(status_code=403, detail="Not enough paint drops. Study more cards!")
+    await conn.commit()
+    invalidate_user(user_id)
+
+def queue_paint(pixel: "PixelUpdate"):
+    """Applies a paid-for pixel to CANVAS and queues it for paint_flusher."""
+    timestamp = time.time()
+    set_canvas_pixel(pixel.x, pixel.y, pixel.color)
+    PENDING_PIXELS[(pixel.x, pixel.y)] = (pixel.color, pixel.user_id, timestamp)
+    PIXEL_CACHE.pop((pixel.x, pixel.y), None)
+    PENDING_PAINTS.put_nowait((pixel.color, pixel.user_id, timestamp, pixel.x, pixel.y))
+
 # --- Models ---
 class PixelUpdate(BaseModel):
     x: int
@@ -113,46 +396,65 @@ class CanvasPixel(BaseModel):
 # --- Routes ---
 
 @app.get("/canvas")
-def get_canvas():
+async def get_canvas(if_none_match: Optional[str] = Header(None)):
     """Returns the entire 32x32 canvas state."""
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT x, y, color FROM canvas')
-    rows = c.fetchall()
-    conn.close()
+    global CANVAS_JSON
+    
+    # Pollers that send back the last ETag get an empty 304 until someone paints
+    etag = canvas_etag()
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
     
-    # Convert to a simple 2D array or list of objects
-    # For bandwidth efficiency, let's return a flat list of integers (32*32 = 1024 ints)
+    # For bandwidth efficiency, return a flat list of integers (32*32 = 1024 ints)
     # The client can reconstruct the grid.
     # Order: row by row (y=0, x=0..31; y=1, x=0..31)
-    grid = [0] * (32 * 32)
-    for row in rows:
-        idx = row['y'] * 32 + row['x']
-        if 0 <= idx < 1024:
-            grid[idx] = row['color']
-            
-    return {"canvas": grid}
+    if CANVAS_JSON is None:
+        CANVAS_JSON = orjson.dumps({"canvas": list(CANVAS)})
+    return Response(content=CANVAS_JSON, media_type="application/json", headers={"ETag": etag})
+
+@app.get("/canvas/version")
+async def get_canvas_version():
+    """Returns the current canvas version; it changes whenever a pixel is painted."""
+    return {"v": CANVAS_VERSION}
+
+@app.get("/canvas.bin")
+async def get_canvas_bin(if_none_match: Optional[str] = Header(None)):
+    """Returns the canvas as 1024 raw bytes, one color index per pixel (same order as /canvas)."""
+    etag = canvas_etag()
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=bytes(CANVAS), media_type="application/octet-stream", headers={"ETag": etag})
 
 @app.get("/pixel/{x}/{y}")
-def get_pixel_details(x: int, y: int):
+async def get_pixel_details(x: int, y: int):
     """Returns details about a specific pixel (who painted it, when)."""
-    if not (0 <= x < 32 and 0 <= y < 32):
+    if not in_bounds(x, y):
         raise HTTPException(status_code=400, detail="Coordinates out of bounds")
+    
+    # Painted but not flushed yet: the database row is still the old one
+    pending = PENDING_PIXELS.get((x, y))
+    if pending is not None:
+        color, user_id, timestamp = pending
+        user = await get_user_row(user_id)
+        return {
+            "x": x,
+            "y": y,
+            "color": color,
+            "last_user_id": user_id,
+            "username": user['username'] if user else None,
+            "last_modified": timestamp
+        }
+    
+    details = PIXEL_CACHE.get((x, y))
+    if details is not None:
+        return details
         
-    conn = get_db_connection()
-    c = conn.cursor()
-    # Join with users table to get username
-    c.execute('''
-        SELECT canvas.*, users.username 
-        FROM canvas 
-        LEFT JOIN users ON canvas.last_user_id = users.user_id
-        WHERE x = ? AND y = ?
-    ''', (x, y))
-    row = c.fetchone()
-    conn.close()
+    version = CANVAS_VERSION
+    async with read_db() as conn:
+        row = await fetch_one(conn, SQL_GET_PIXEL, (x, y))
     
     if row:
-        return {
+        details = {
             "x": row['x'],
             "y": row['y'],
             "color": row['color'],
@@ -160,117 +462,101 @@ def get_pixel_details(x: int, y: int):
             "username": row['username'], # Added field
             "last_modified": row['last_modified']
         }
+        # Don't cache a row that a paint may have overtaken while we were reading it
+        if CANVAS_VERSION == version:
+            PIXEL_CACHE[(x, y)] = details
+        return details
     else:
         return {"error": "Pixel not found"}
 
 @app.post("/paint")
-def paint_pixel(pixel: PixelUpdate):
+async def paint_pixel(pixel: PixelUpdate, conn: aiosqlite.Connection = Depends(get_write_db)):
     """Updates a pixel's color."""
-    if not (0 <= pixel.x < 32 and 0 <= pixel.y < 32):
+    if not in_bounds(pixel.x, pixel.y):
         raise HTTPException(status_code=400, detail="Coordinates out of bounds")
-    if not (0 <= pixel.color < 16): # Assuming 16 colors
+    if not valid_color(pixel.color):
          raise HTTPException(status_code=400, detail="Invalid color index (0-15)")
 
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Optional: Verify user_id exists? For now, we trust the client or auto-create?
-    # Let's enforce user existence for better tracking
-    c.execute('SELECT paint_balance FROM users WHERE user_id = ?', (pixel.user_id,))
-    row = c.fetchone()
-    if not row:
-         conn.close()
-         raise HTTPException(status_code=404, detail="User ID not found. Register first.")
+    await debit_paint(conn, pixel.user_id, 1)
     
-    if row['paint_balance'] < 1:
-        conn.close()
-        raise HTTPException(status_code=403, detail="Not enough paint drops. Study more cards!")
+    # The canvas itself is written by paint_flusher
+    queue_paint(pixel)
+    return {"status": "success", "x": pixel.x, "y": pixel.y, "color": pixel.color}
 
-    timestamp = time.time()
-    c.execute('''
-        UPDATE canvas 
-        SET color = ?, last_user_id = ?, last_modified = ?
-        WHERE x = ? AND y = ?
-    ''', (pixel.color, pixel.user_id, timestamp, pixel.x, pixel.y))
+@app.post("/paint/batch")
+async def paint_batch(pixels: List[PixelUpdate], conn: aiosqlite.Connection = Depends(get_write_db)):
+    """Updates up to PAINT_BATCH_MAX pixels for one user, paying for all of them at once.
     
-    # Deduct 1 paint
-    c.execute('UPDATE users SET paint_balance = paint_balance - 1 WHERE user_id = ?', (pixel.user_id,))
+    Invalid pixels are skipped and reported in `results` (same order as the request);
+    the valid ones cost one paint drop each and are painted together, or not at all
+    if the user can't afford them.
+    """
+    if not pixels or len(pixels) > PAINT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"A batch must contain 1-{PAINT_BATCH_MAX} pixels")
+    user_id = pixels[0].user_id
+    if any(pixel.user_id != user_id for pixel in pixels):
+        raise HTTPException(status_code=400, detail="All pixels in a batch must have the same user_id")
     
-    conn.commit()
-    conn.close()
-    return {"status": "success", "x": pixel.x, "y": pixel.y, "color": pixel.color}
+    results = []
+    to_paint = []
+    for pixel in pixels:
+        if not in_bounds(pixel.x, pixel.y):
+            results.append({"status": "error", "x": pixel.x, "y": pixel.y, "detail": "Coordinates out of bounds"})
+        elif not valid_color(pixel.color):
+            results.append({"status": "error", "x": pixel.x, "y": pixel.y, "detail": "Invalid color index (0-15)"})
+        else:
+            results.append({"status": "success", "x": pixel.x, "y": pixel.y, "color": pixel.color})
+            to_paint.append(pixel)
+    
+    if to_paint:
+        await debit_paint(conn, user_id, len(to_paint))
+        for pixel in to_paint:
+            queue_paint(pixel)
+    return {"status": "success", "painted": len(to_paint), "results": results}
 
 @app.post("/user")
-def register_user(user: UserRegister):
+async def register_user(user: UserRegister, conn: aiosqlite.Connection = Depends(get_write_db)):
     """Registers a new user and returns a User ID."""
     new_id = str(uuid.uuid4())
     timestamp = time.time()
     
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO users (user_id, username, created_at) VALUES (?, ?, ?)',
-              (new_id, user.username, timestamp))
-    conn.commit()
-    conn.close()
+    await conn.execute(SQL_INSERT_USER, (new_id, user.username, timestamp))
+    await conn.commit()
     
     return {"user_id": new_id, "username": user.username}
 
 @app.post("/submit-reviews", dependencies=[Depends(verify_secret)])
-def submit_reviews(submission: ReviewSubmission):
+async def submit_reviews(submission: ReviewSubmission, conn: aiosqlite.Connection = Depends(get_write_db)):
     """Processes review proofs and awards paint."""
-    conn = get_db_connection()
-    c = conn.cursor()
-    
     # Verify user exists
-    c.execute('SELECT paint_balance FROM users WHERE user_id = ?', (submission.user_id,))
-    row = c.fetchone()
+    row = await fetch_one(conn, SQL_GET_TOTAL_PROOFS, (submission.user_id,))
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="User not found")
     
-    current_balance = row['paint_balance']
-    new_proofs_count = 0
-    
-    for proof in submission.proofs:
-        # Check if this proof was already submitted
-        c.execute('SELECT 1 FROM review_proofs WHERE user_id = ? AND card_id = ? AND timestamp = ?',
-                  (submission.user_id, proof.card_id, proof.timestamp))
-        if not c.fetchone():
-            # New proof!
-            c.execute('INSERT INTO review_proofs (user_id, card_id, timestamp) VALUES (?, ?, ?)',
-                      (submission.user_id, proof.card_id, proof.timestamp))
-            new_proofs_count += 1
+    # The primary key rejects proofs that were already submitted; the change
+    # counter tells us how many were actually new.
+    changes_before = conn.total_changes
+    await conn.executemany(SQL_INSERT_PROOF,
+                           [(submission.user_id, proof.card_id, proof.timestamp) for proof in submission.proofs])
+    new_proofs_count = conn.total_changes - changes_before
     
     # Award paint based on total count to handle small batches correctly
-    c.execute('SELECT count(*) FROM review_proofs WHERE user_id = ?', (submission.user_id,))
-    total_proofs = c.fetchone()[0]
-    
-    # Simple strategy: Total paint ever earned should be total_proofs // 10
-    # We need to know how much has already been awarded to increment correctly.
-    # For now, let's keep it simple: if new_proofs_count > 0, check if we crossed a 10-threshold.
-    # Improved: Each user has a 'total_paint_earned' column or we just use balance + pixels_painted.
-    # Let's add 'total_proofs' or similar to 'users' table to track thresholds safely.
+    # Total paint ever earned is total_proofs // 10, so award the 10-thresholds crossed by this batch
+    previous_total = row['total_proofs'] or 0
+    total_proofs = previous_total + new_proofs_count
+    paint_awarded = (total_proofs // 10) - (previous_total // 10)
     
-    # EVEN EASIER: Just award 1 paint if current_total % 10 < previous_total % 10 (wrapped around)
-    # Actually, let's just use: (total_proofs // 10) - ( (total_proofs - new_proofs_count) // 10 )
-    paint_awarded = (total_proofs // 10) - ((total_proofs - new_proofs_count) // 10)
+    if new_proofs_count > 0:
+        await conn.execute(SQL_AWARD_PAINT, (total_proofs, paint_awarded, submission.user_id))
     
-    if paint_awarded > 0:
-        c.execute('UPDATE users SET paint_balance = paint_balance + ? WHERE user_id = ?',
-                  (paint_awarded, submission.user_id))
-    
-    conn.commit()
-    conn.close()
+    await conn.commit()
+    invalidate_user(submission.user_id)
     
     return {"status": "success", "new_proofs": new_proofs_count, "paint_awarded": paint_awarded}
 
 @app.get("/user/{user_id}/balance")
-def get_balance(user_id: str):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT paint_balance FROM users WHERE user_id = ?', (user_id,))
-    row = c.fetchone()
-    conn.close()
+async def get_balance(user_id: str):
+    row = await get_user_row(user_id)
     
     if row:
         return {"user_id": user_id, "paint_balance": row['paint_balance']}
@@ -278,12 +564,8 @@ def get_balance(user_id: str):
         raise HTTPException(status_code=404, detail="User not found")
 
 @app.get("/user/{user_id}")
-def get_user(user_id: str):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT username, created_at FROM users WHERE user_id = ?', (user_id,))
-    row = c.fetchone()
-    conn.close()
+async def get_user(user_id: str):
+    row = await get_user_row(user_id)
     
     if row:
         return {"user_id": user_id, "username": row['username'], "created_at": row['created_at']}